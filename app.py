@@ -1,9 +1,18 @@
 import streamlit as st
-from file_processor import FileProcessor
 import os
 import time
-from datetime import datetime
-import pandas as pd
+import concurrent.futures
+import logging
+import logging.handlers
+import queue
+
+logging.basicConfig(level=logging.INFO)
+
+# How often the progress readout refreshes while files are processed
+PROGRESS_POLL_SECONDS = 0.5
+
+# Upper bound on uploads processed at the same time
+MAX_PARALLEL_UPLOADS = 4
 
 # Set page config
 st.set_page_config(
@@ -12,9 +21,38 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state for file processor if it doesn't exist
-if 'file_processor' not in st.session_state:
-    st.session_state.file_processor = FileProcessor()
+@st.cache_resource
+def get_stats_logger(log_path):
+    """Return the processing stats logger; its file writes happen on a background thread."""
+    log_queue = queue.SimpleQueue()
+    file_handler = logging.FileHandler(log_path)
+    file_handler.setFormatter(logging.Formatter("\n%(asctime)s\n%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+
+    stats_logger = logging.getLogger("musicsynth.stats")
+    stats_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    stats_logger.setLevel(logging.INFO)
+    stats_logger.propagate = False
+    return stats_logger
+
+def process_timed(file_processor, uploaded_file, digest):
+    """Process one upload and return its (success, message, output_path) result and duration."""
+    start = time.perf_counter()
+    result = file_processor.process_uploaded_file(uploaded_file, digest=digest)
+    return result, time.perf_counter() - start
+
+@st.cache_resource
+def get_file_processor():
+    """Return the FileProcessor shared by all sessions, importing the processing stack on first use."""
+    # Import the processing code only once a file is actually uploaded so
+    # the initial page render stays light
+    from file_processor import FileProcessor
+    return FileProcessor()
+
+# Results of files already processed in this session, keyed by name and content hash
+if 'processed_files' not in st.session_state:
+    st.session_state.processed_files = {}
 
 st.title("🎵 MusicSynth - Sheet Music Visualizer")
 
@@ -24,83 +62,121 @@ if is_cloud:
     st.info("Running in Streamlit Cloud environment. Image processing is not available. Please upload MusicXML files only.")
 
 # File upload section
-st.header("Upload MusicXML or Image File")
-uploaded_file = st.file_uploader(
-    "Choose a MusicXML file (.musicxml, .xml) or an image file (.png, .jpg, .jpeg)",
-    type=['musicxml', 'xml', 'png', 'jpg', 'jpeg'] if not is_cloud else ['musicxml', 'xml']
+st.header("Upload MusicXML or Image Files")
+uploaded_files = st.file_uploader(
+    "Choose MusicXML files (.musicxml, .xml) or image files (.png, .jpg, .jpeg)",
+    type=['musicxml', 'xml', 'png', 'jpg', 'jpeg'] if not is_cloud else ['musicxml', 'xml'],
+    accept_multiple_files=True
 )
 
-if uploaded_file is not None:
-    # Initialize timing statistics
-    timing_stats = {
-        'start_time': time.time(),
-        'steps': {}
-    }
-    
-    # Process the uploaded file
-    with st.spinner("Processing your file..."):
-        st.info("Starting file processing...")
-        
-        # Track file processing time
-        process_start = time.time()
-        success, message, output_path = st.session_state.file_processor.process_uploaded_file(uploaded_file)
-        timing_stats['steps']['file_processing'] = time.time() - process_start
-        
+if uploaded_files:
+    file_processor = get_file_processor()
+
+    # Streamlit reruns this script on every widget interaction, so reuse
+    # the video of an identical upload instead of rendering it again
+    cache_keys = [
+        (uploaded_file.name, file_processor.content_digest(uploaded_file))
+        for uploaded_file in uploaded_files
+    ]
+    results = {}
+    for index, cache_key in enumerate(cache_keys):
+        cached_result = st.session_state.processed_files.get(cache_key)
+        if cached_result is not None and os.path.exists(cached_result[2]):
+            results[index] = (cached_result, 0.0, False)
+
+    # Process the remaining files concurrently
+    pending = [index for index in range(len(uploaded_files)) if index not in results]
+    if pending:
+        with st.spinner("Processing your files..."):
+            st.info(f"Starting processing of {len(pending)} file(s)...")
+            process_start = time.perf_counter()
+            # Work runs on worker threads so the script thread can keep the
+            # progress readout updating while Oemer and the renders run
+            progress = st.empty()
+            workers = min(MAX_PARALLEL_UPLOADS, len(pending))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(
+                        process_timed, file_processor, uploaded_files[index], cache_keys[index][1]
+                    ): index
+                    for index in pending
+                }
+                while not all(future.done() for future in futures):
+                    finished = sum(future.done() for future in futures)
+                    progress.caption(
+                        f"Processed {finished}/{len(futures)} file(s)... "
+                        f"{time.perf_counter() - process_start:.0f}s elapsed"
+                    )
+                    time.sleep(PROGRESS_POLL_SECONDS)
+            progress.empty()
+
+        for future, index in futures.items():
+            result, duration = future.result()
+            results[index] = (result, duration, True)
+            if result[0]:
+                st.session_state.processed_files[cache_keys[index]] = result
+
+    for index, uploaded_file in enumerate(uploaded_files):
+        (success, message, output_path), processing_time, fresh = results[index]
+        st.subheader(uploaded_file.name)
+
         if success:
             st.success(message)
             
+            # Initialize timing statistics
+            timing_stats = {'steps': {'file_processing': processing_time}}
+
             # Track video generation time
-            video_start = time.time()
+            video_start = time.perf_counter()
             
+            # Read the video once and share the bytes between preview and download
+            with open(output_path, 'rb') as video_file:
+                video_bytes = video_file.read()
+
             # Try to display the video
             try:
-                with open(output_path, 'rb') as video_file:
-                    video_bytes = video_file.read()
-                    st.video(video_bytes)
+                st.video(video_bytes)
             except Exception as e:
                 st.warning("Video preview is not available. You can download the video file instead.")
-            
+
             # Add download button for the video
-            with open(output_path, 'rb') as video_file:
-                video_bytes = video_file.read()
-                st.download_button(
-                    label="Download Video",
-                    data=video_bytes,
-                    file_name=os.path.basename(output_path),
-                    mime="video/mp4"
-                )
+            st.download_button(
+                label="Download Video",
+                data=video_bytes,
+                file_name=os.path.basename(output_path),
+                mime="video/mp4",
+                key=f"download_{index}"
+            )
             
-            timing_stats['steps']['video_generation'] = time.time() - video_start
+            timing_stats['steps']['video_generation'] = time.perf_counter() - video_start
             
             # Calculate total time
-            timing_stats['total_time'] = time.time() - timing_stats['start_time']
+            timing_stats['total_time'] = sum(timing_stats['steps'].values())
             
             # Display timing statistics
-            st.subheader("Processing Statistics")
-            stats_df = pd.DataFrame({
-                'Step': list(timing_stats['steps'].keys()),
-                'Time (seconds)': [f"{t:.2f}" for t in timing_stats['steps'].values()]
-            })
-            stats_df.loc[len(stats_df)] = ['Total Time', f"{timing_stats['total_time']:.2f}"]
-            st.table(stats_df)
+            st.markdown("**Processing Statistics**")
+            stat_columns = st.columns(len(timing_stats['steps']) + 1)
+            for column, (step, duration) in zip(stat_columns, timing_stats['steps'].items()):
+                column.metric(step, f"{duration:.2f}s")
+            stat_columns[-1].metric("Total Time", f"{timing_stats['total_time']:.2f}s")
             
-            # Save timing statistics to a log file
-            log_entry = f"\n{datetime.now()}\n"
-            log_entry += f"File: {uploaded_file.name}\n"
-            for step, duration in timing_stats['steps'].items():
-                log_entry += f"{step}: {duration:.2f} seconds\n"
-            log_entry += f"Total Time: {timing_stats['total_time']:.2f} seconds\n"
-            log_entry += "-" * 50
-            
-            log_path = os.path.join(st.session_state.file_processor.temp_dir, 'processing_stats.log')
-            with open(log_path, 'a') as f:
-                f.write(log_entry)
+            # Save timing statistics to a log file (only for files processed on this run)
+            if fresh:
+                log_path = os.path.join(file_processor.temp_dir, 'processing_stats.log')
+                step_lines = "".join(
+                    f"{step}: {duration:.2f} seconds\n" for step, duration in timing_stats['steps'].items()
+                )
+                get_stats_logger(log_path).info(
+                    "File: %s\n%sTotal Time: %.2f seconds\n%s",
+                    uploaded_file.name, step_lines, timing_stats['total_time'], "-" * 50
+                )
         else:
             st.error(message)
 
 # Add a cleanup button
 if st.button("Clean Up Temporary Files"):
-    st.session_state.file_processor.cleanup()
+    get_file_processor().cleanup()
+    st.session_state.processed_files.clear()
     st.success("Temporary files cleaned up successfully!")
 
 # Add footer
@@ -1,12 +1,61 @@
 import os
+import collections
+import hashlib
+import logging
 import tempfile
 import subprocess
+import threading
 import time
-from datetime import datetime
-import streamlit as st
-from synthesia import parse_musicxml, make_video
 import shutil
-import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Accepted upload extensions, matched against the lowercased file name
+_XML_EXTS = ('.musicxml', '.xml')
+_IMG_EXTS = ('.png', '.jpg', '.jpeg')
+
+# Largest upload accepted for processing
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Number of trailing Oemer output lines reported when it fails
+OEMER_ERROR_LINES = 20
+
+# Oemer runs still going after this long are killed
+OEMER_TIMEOUT_SECONDS = 600
+
+# Worker threads for disk housekeeping kept off the request path
+_BACKGROUND_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix='musicsynth-bg')
+
+# Session directories untouched for this long are swept on the next upload
+SESSION_TTL_SECONDS = 60 * 60
+
+# Free space /dev/shm must have before session files are placed there
+SHM_MIN_FREE_BYTES = 1 << 30
+
+def _scratch_base():
+    """Return /dev/shm if it is available with room to spare, else None for the system temp dir."""
+    try:
+        if shutil.disk_usage('/dev/shm').free >= SHM_MIN_FREE_BYTES:
+            return '/dev/shm'
+    except OSError:
+        pass
+    return None
+
+def _write_file(path, data):
+    """Write a bytes-like object to path with raw os.write calls, bypassing Python's buffered I/O."""
+    view = memoryview(data)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        # os.write may accept fewer bytes than offered, so keep going until done
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+# Resolved once per process; None when Oemer is unavailable
+_OEMER_PATH = None if os.environ.get('STREAMLIT_SERVER_ENVIRONMENT') == 'cloud' else shutil.which("oemer")
 
 class FileProcessor:
     def __init__(self):
@@ -16,40 +65,43 @@ class FileProcessor:
         # Create temp and xml directories in the project folder
         self.temp_dir = os.path.join(self.project_dir, 'temp')
         self.xml_dir = os.path.join(self.project_dir, 'xml_files')
+        # Oemer results keyed by image content hash, shared by all sessions
+        self.omr_cache_dir = os.path.join(self.project_dir, 'omr_cache')
+        # Keeping a copy of every MusicXML processed is opt-in; nothing reads it back
+        self.archive_xml = bool(os.environ.get('ARCHIVE_XML'))
         
         # Create necessary directories with proper permissions
-        for directory in [self.temp_dir, self.xml_dir]:
-            if not os.path.exists(directory):
-                os.makedirs(directory, mode=0o777, exist_ok=True)
-            else:
-                # Ensure existing directories have proper permissions
-                os.chmod(directory, 0o777)
-        
-        self.timing_stats = {}
-        
-        # Check if we're running in Streamlit Cloud
-        is_streamlit_cloud = os.environ.get('STREAMLIT_SERVER_ENVIRONMENT') == 'cloud'
+        directories = [self.temp_dir, self.omr_cache_dir]
+        if self.archive_xml:
+            directories.append(self.xml_dir)
+        for directory in directories:
+            os.makedirs(directory, mode=0o777, exist_ok=True)
+
+        # Per-upload session directories are scratch space that Oemer and the
+        # video render hit hard, so keep them on RAM-backed storage when possible
+        self.work_dir = tempfile.mkdtemp(prefix='musicsynth_', dir=_scratch_base())
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.work_dir, True)
         
-        if is_streamlit_cloud:
-            self.use_cloud_omr = True
+        # Fall back to cloud mode (MusicXML only) on Streamlit Cloud or without Oemer
+        self.oemer_path = _OEMER_PATH
+        self.use_cloud_omr = _OEMER_PATH is None
+        if self.use_cloud_omr:
+            logger.warning("Oemer is not available; image uploads are disabled")
         else:
-            try:
-                result = subprocess.run(["which", "oemer"], capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise RuntimeError("Oemer executable not found. Please ensure it is installed and in your PATH.")
-                self.oemer_path = result.stdout.strip()
-                self.use_cloud_omr = False
-                print(f"Oemer path: {self.oemer_path}")
-            except Exception as e:
-                print(f"Error setting up Oemer: {str(e)}")
-                self.use_cloud_omr = True
+            logger.info("Oemer path: %s", self.oemer_path)
     
-    def process_uploaded_file(self, uploaded_file):
+    @staticmethod
+    def content_digest(uploaded_file):
+        """Return the hex BLAKE2b-128 digest of an uploaded file's bytes."""
+        return hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+
+    def process_uploaded_file(self, uploaded_file, digest=None):
         """
         Process an uploaded MusicXML or image file and generate a video visualization.
         
         Args:
             uploaded_file: The uploaded file object from Streamlit
+            digest: content_digest() of the file, if the caller already computed it
             
         Returns:
             tuple: (success, message, output_path)
@@ -58,118 +110,194 @@ class FileProcessor:
             return False, "No file uploaded", None
         
         filename = uploaded_file.name.lower()
-        is_musicxml = filename.endswith('.musicxml') or filename.endswith('.xml')
-        is_image = filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg')
+        # Upload names carry no directory part, so splitext alone gives the stem
+        base_name = os.path.splitext(uploaded_file.name)[0]
+        is_musicxml = filename.endswith(_XML_EXTS)
+        is_image = filename.endswith(_IMG_EXTS)
         
         if not (is_musicxml or is_image):
             return False, "Please upload a MusicXML file (.musicxml, .xml) or an image file (.png, .jpg, .jpeg)", None
         
+        # Reject oversized uploads before any disk or Oemer work is done
+        if uploaded_file.getbuffer().nbytes > MAX_UPLOAD_BYTES:
+            return False, f"File is too large; the maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB", None
+        
+        # Timings are per call so concurrent uploads don't overwrite each other
+        timing_stats = {}
+        # Archive copy running alongside parsing and rendering, if any
+        archive_future = None
+
+        # Reclaim scratch space from sessions nobody cleaned up
+        _BACKGROUND_POOL.submit(self._remove_sessions, time.time() - SESSION_TTL_SECONDS)
+
         try:
-            # Create a unique session directory using UUID
-            session_id = str(uuid.uuid4())
-            session_dir = os.path.join(self.temp_dir, f"session_{session_id}")
-            os.makedirs(session_dir, mode=0o777, exist_ok=True)
-            print(f"Created session directory: {session_dir}")
-            
-            # Save the uploaded file to the session directory
-            save_start = time.time()
-            temp_file_path = os.path.join(session_dir, uploaded_file.name)
-            print(f"Saving uploaded file to: {temp_file_path}")
-            with open(temp_file_path, 'wb') as f:
-                f.write(uploaded_file.getbuffer())
-            # Ensure file has proper permissions
-            os.chmod(temp_file_path, 0o666)
-            self.timing_stats['file_save'] = time.time() - save_start
+            # Create a unique session directory from 128 random bits
+            session_id = os.urandom(16).hex()
+            session_dir = os.path.join(self.work_dir, f"session_{session_id}")
+            # work_dir always exists and the name is unique, so one mkdir suffices
+            os.mkdir(session_dir, mode=0o700)
+            logger.info("Created session directory: %s", session_dir)
             
             # If image, process it based on environment
             if is_image:
                 if self.use_cloud_omr:
                     return False, "Image processing is currently not supported in the cloud environment. Please upload a MusicXML file instead.", None
                 else:
-                    # Use Oemer for local processing
-                    print(f"Running Oemer on image: {temp_file_path}")
-                    cmd = [self.oemer_path, "-o", session_dir, "--save-cache", "-d", temp_file_path]
-                    oemer_start = time.time()
-                    result = subprocess.run(cmd, capture_output=True, text=True)
-                    if result.returncode != 0:
-                        print(f"Oemer failed with error: {result.stderr}")
-                        return False, f"Oemer failed: {result.stderr}", None
-                    self.timing_stats['oemer_processing'] = time.time() - oemer_start
-                    
-                    # Find the output MusicXML file
-                    basename = os.path.splitext(os.path.basename(temp_file_path))[0]
-                    musicxml_path = os.path.join(session_dir, f"{basename}.musicxml")
-                    if not os.path.exists(musicxml_path):
-                        musicxml_path = os.path.join(session_dir, f"{basename}.xml")
-                        if not os.path.exists(musicxml_path):
-                            print(f"Oemer did not produce a MusicXML file for {basename}")
-                            return False, f"Oemer did not produce a MusicXML file for {basename}", None
-                    
-                    # Save a copy of the MusicXML file in the xml_files directory
-                    xml_filename = f"{basename}_{session_id}.musicxml"
+                    # Reuse the MusicXML Oemer produced for a byte-identical image
+                    if digest is None:
+                        digest = self.content_digest(uploaded_file)
+                    cached_xml_path = os.path.join(self.omr_cache_dir, f"{digest}.musicxml")
+                    if os.path.exists(cached_xml_path):
+                        musicxml_path = cached_xml_path
+                        logger.info("Using cached Oemer output: %s", musicxml_path)
+                    else:
+                        # Oemer is a CLI, so the image only goes to disk when it has to run
+                        save_start = time.perf_counter()
+                        temp_file_path = os.path.join(session_dir, uploaded_file.name)
+                        logger.info("Saving uploaded file to: %s", temp_file_path)
+                        _write_file(temp_file_path, uploaded_file.getbuffer())
+                        timing_stats['file_save'] = time.perf_counter() - save_start
+
+                        oemer_start = time.perf_counter()
+                        musicxml_path, error = self._run_oemer(temp_file_path, session_dir)
+                        if musicxml_path is None:
+                            return False, error, None
+                        timing_stats['oemer_processing'] = time.perf_counter() - oemer_start
+                        logger.info("Oemer produced MusicXML file: %s", musicxml_path)
+
+                        # Publish to the cache atomically so concurrent sessions never see a partial file
+                        partial_path = f"{cached_xml_path}.{session_id}.tmp"
+                        shutil.copyfile(musicxml_path, partial_path)
+                        os.replace(partial_path, cached_xml_path)
+
+                    # Save a copy of the MusicXML file in the xml_files directory;
+                    # nothing below depends on it, so it overlaps with the render
+                    if self.archive_xml:
+                        xml_filename = f"{base_name}_{session_id}.musicxml"
+                        xml_save_path = os.path.join(self.xml_dir, xml_filename)
+                        archive_future = _BACKGROUND_POOL.submit(self._archive_copy, musicxml_path, xml_save_path)
+                    musicxml_source = musicxml_path
+            else:
+                # Parse the upload straight from memory; it only touches disk
+                # when it is archived in the xml_files directory
+                uploaded_file.seek(0)
+                musicxml_source = uploaded_file
+                if self.archive_xml:
+                    xml_filename = f"{base_name}_{session_id}.musicxml"
                     xml_save_path = os.path.join(self.xml_dir, xml_filename)
-                    shutil.copy2(musicxml_path, xml_save_path)
+                    _write_file(xml_save_path, uploaded_file.getbuffer())
                     os.chmod(xml_save_path, 0o666)  # Ensure XML file has proper permissions
-                    print(f"Saved MusicXML file to: {xml_save_path}")
-                    
-                    print(f"Oemer produced MusicXML file: {musicxml_path}")
-            else:
-                # Use the uploaded MusicXML file
-                musicxml_path = temp_file_path
-                # Save a copy in the xml_files directory
-                xml_filename = f"{os.path.splitext(os.path.basename(musicxml_path))[0]}_{session_id}.musicxml"
-                xml_save_path = os.path.join(self.xml_dir, xml_filename)
-                shutil.copy2(musicxml_path, xml_save_path)
-                os.chmod(xml_save_path, 0o666)  # Ensure XML file has proper permissions
-                print(f"Saved MusicXML file to: {xml_save_path}")
-                print(f"Using uploaded MusicXML file: {musicxml_path}")
+                    logger.info("Saved MusicXML file to: %s", xml_save_path)
+                logger.info("Using uploaded MusicXML file: %s", uploaded_file.name)
             
+            # synthesia pulls in imageio-ffmpeg, numpy and PIL; load them only once
+            # there is a score to render
+            from synthesia import parse_musicxml, make_video
+
             # Parse the MusicXML file
-            print(f"Parsing MusicXML file: {musicxml_path}")
-            notes = parse_musicxml(musicxml_path)
+            logger.info("Parsing MusicXML for: %s", uploaded_file.name)
+            notes = parse_musicxml(musicxml_source)
             
             # Generate output video path
-            output_filename = os.path.splitext(os.path.basename(musicxml_path))[0] + '_visualization.mp4'
+            output_filename = base_name + '_visualization.mp4'
             output_path = os.path.join(session_dir, output_filename)
             
             # Create the video
-            print(f"Generating video: {output_path}")
-            video_start = time.time()
-            make_video(notes, output_file=output_path)
-            os.chmod(output_path, 0o666)  # Ensure video file has proper permissions
-            self.timing_stats['video_generation'] = time.time() - video_start
+            logger.info("Generating video: %s", output_path)
+            video_start = time.perf_counter()
+            # Render in this process: the app already runs several uploads in
+            # parallel, and spawned workers would re-import the Streamlit script
+            make_video(notes, output_file=output_path, workers=1)
+            timing_stats['video_generation'] = time.perf_counter() - video_start
+
+            # Surface any archive copy failure like the inline copy used to
+            if archive_future is not None:
+                archive_future.result()
             
             # Log timing statistics
-            self._log_timing_stats(uploaded_file.name, session_dir)
+            self._log_timing_stats(uploaded_file.name, timing_stats)
             
             return True, "Video generated successfully", output_path
             
         except Exception as e:
-            print(f"Error processing file: {str(e)}")
+            logger.exception("Error processing file: %s", e)
             return False, f"Error processing file: {str(e)}", None
         
+    def _run_oemer(self, image_path, session_dir):
+        """
+        Run Oemer on an image and locate the MusicXML file it writes.
+
+        Returns:
+            tuple: (musicxml_path, error_message); musicxml_path is None on failure
+        """
+        logger.info("Running Oemer on image: %s", image_path)
+        cmd = [self.oemer_path, "-o", session_dir, "--save-cache", "-d", image_path]
+        # Relay Oemer's progress while it runs instead of buffering
+        # everything until exit; keep the tail for error reporting
+        oemer_output = collections.deque(maxlen=OEMER_ERROR_LINES)
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True, bufsize=1) as proc:
+            timed_out = threading.Event()
+
+            def kill_oemer():
+                timed_out.set()
+                proc.kill()
+
+            # Killing Oemer closes its stdout, which ends the read loop below
+            watchdog = threading.Timer(OEMER_TIMEOUT_SECONDS, kill_oemer)
+            watchdog.start()
+            try:
+                for line in proc.stdout:
+                    line = line.rstrip()
+                    logger.info("oemer: %s", line)
+                    oemer_output.append(line)
+            finally:
+                watchdog.cancel()
+        if timed_out.is_set() and proc.returncode != 0:
+            logger.error("Oemer timed out after %d seconds", OEMER_TIMEOUT_SECONDS)
+            return None, f"Oemer timed out after {OEMER_TIMEOUT_SECONDS} seconds"
+        if proc.returncode != 0:
+            error_output = "\n".join(oemer_output)
+            logger.error("Oemer failed with error: %s", error_output)
+            return None, f"Oemer failed: {error_output}"
+
+        # Find the output MusicXML file
+        basename = os.path.splitext(os.path.basename(image_path))[0]
+        for extension in ('.musicxml', '.xml'):
+            musicxml_path = os.path.join(session_dir, basename + extension)
+            if os.path.exists(musicxml_path):
+                return musicxml_path, None
+        logger.error("Oemer did not produce a MusicXML file for %s", basename)
+        return None, f"Oemer did not produce a MusicXML file for {basename}"
+
+    def _archive_copy(self, musicxml_path, xml_save_path):
+        """Copy a MusicXML file into the xml_files archive."""
+        shutil.copy2(musicxml_path, xml_save_path)
+        os.chmod(xml_save_path, 0o666)  # Ensure XML file has proper permissions
+        logger.info("Saved MusicXML file to: %s", xml_save_path)
+
     def cleanup(self):
-        """Clean up temporary files"""
+        """Clean up temporary files; the deletes run in the background."""
+        _BACKGROUND_POOL.submit(self._remove_sessions)
+
+    def _remove_sessions(self, modified_before=None):
+        """Delete session directories, or only those last modified before the given timestamp."""
         try:
-            # Clean up all session directories
-            for item in os.listdir(self.temp_dir):
-                item_path = os.path.join(self.temp_dir, item)
-                if os.path.isdir(item_path) and item.startswith('session_'):
-                    shutil.rmtree(item_path, ignore_errors=True)
-            # Recreate the base temp directory with proper permissions
-            os.makedirs(self.temp_dir, mode=0o777, exist_ok=True)
+            # scandir reports entry types from the directory listing itself,
+            # so only the age check needs a stat
+            with os.scandir(self.work_dir) as entries:
+                for entry in entries:
+                    if not (entry.name.startswith('session_') and entry.is_dir(follow_symlinks=False)):
+                        continue
+                    if modified_before is not None and entry.stat(follow_symlinks=False).st_mtime >= modified_before:
+                        continue
+                    shutil.rmtree(entry.path, ignore_errors=True)
         except Exception as e:
-            print(f"Error during cleanup: {str(e)}")
+            logger.exception("Error during cleanup: %s", e)
     
-    def _log_timing_stats(self, filename, session_dir):
-        """Log timing statistics to a file."""
-        log_entry = f"\n{datetime.now()}\n"
-        log_entry += f"File: {filename}\n"
-        for step, duration in self.timing_stats.items():
-            log_entry += f"{step}: {duration:.2f} seconds\n"
-        log_entry += "-" * 50
-        
-        log_path = os.path.join(session_dir, 'processing_stats.log')
-        with open(log_path, 'a') as f:
-            f.write(log_entry)
-        os.chmod(log_path, 0o666)  # Ensure log file has proper permissions 
\ No newline at end of file
+    def _log_timing_stats(self, filename, timing_stats):
+        """Log per-step timing statistics for a processed file."""
+        logger.info(
+            "Timing for %s: %s", filename,
+            ", ".join(f"{step}={duration:.2f}s" for step, duration in timing_stats.items())
+        )
@@ -5,10 +5,15 @@ of notes to play on a violin fingerboard from a musicxml file.
 """
 
 import os
+import functools
+import math
+import multiprocessing
+import subprocess
+import tempfile
 import xml.etree.ElementTree as ET
+import imageio_ffmpeg
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
-from moviepy import *
 
 # Violin string notes (G3, D4, A4, E5)
 VIOLIN_STRINGS = ["G", "D", "A", "E"]
@@ -22,36 +27,66 @@ FB_HEIGHT = 300
 STRING_SPACING = FB_HEIGHT // 5
 FRET_SPACING = FB_WIDTH // 16
 
-# Define the note positions on each string
-# This is a simplified mapping of notes to finger positions
-NOTE_POSITIONS = {
-    # G string (G3 to G5)
-    "G3": (0, 0), "G#3": (1, 0), "A3": (2, 0), "A#3": (3, 0), 
-    "B3": (4, 0), "C4": (5, 0), "C#4": (6, 0), "D4": (7, 0),
-    "D#4": (8, 0), "E4": (9, 0), "F4": (10, 0), "F#4": (11, 0),
-    "G4": (12, 0), "G#4": (13, 0), "A4": (14, 0), "A#4": (15, 0),
-    
-    # D string (D4 to D6)
-    "D4": (0, 1), "D#4": (1, 1), "E4": (2, 1), "F4": (3, 1),
-    "F#4": (4, 1), "G4": (5, 1), "G#4": (6, 1), "A4": (7, 1),
-    "A#4": (8, 1), "B4": (9, 1), "C5": (10, 1), "C#5": (11, 1),
-    "D5": (12, 1), "D#5": (13, 1), "E5": (14, 1), "F5": (15, 1),
-    
-    # A string (A4 to A6)
-    "A4": (0, 2), "A#4": (1, 2), "B4": (2, 2), "C5": (3, 2),
-    "C#5": (4, 2), "D5": (5, 2), "D#5": (6, 2), "E5": (7, 2),
-    "F5": (8, 2), "F#5": (9, 2), "G5": (10, 2), "G#5": (11, 2),
-    "A5": (12, 2), "A#5": (13, 2), "B5": (14, 2), "C6": (15, 2),
-    
-    # E string (E5 to E7)
-    "E5": (0, 3), "F5": (1, 3), "F#5": (2, 3), "G5": (3, 3),
-    "G#5": (4, 3), "A5": (5, 3), "A#5": (6, 3), "B5": (7, 3),
-    "C6": (8, 3), "C#6": (9, 3), "D6": (10, 3), "D#6": (11, 3),
-    "E6": (12, 3), "F6": (13, 3), "F#6": (14, 3), "G6": (15, 3),
-}
+def _load_font(size):
+    """Load Arial at the given size, falling back to Pillow's default font."""
+    try:
+        return ImageFont.truetype("Arial", size)
+    except OSError:
+        return ImageFont.load_default()
+
+# Font of the title line, loaded once rather than per frame
+TITLE_FONT = _load_font(24)
+
+# Radius of the note markers drawn on the fingerboard
+NOTE_RADIUS = 10
+
+def _note_sprite(fill):
+    """Rasterize a note marker once as an RGBA image whose alpha doubles as its paste mask."""
+    size = 2 * NOTE_RADIUS + 1
+    sprite = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    ImageDraw.Draw(sprite).ellipse((0, 0, size - 1, size - 1), fill=fill, outline=(255, 255, 255))
+    return sprite
+
+INACTIVE_NOTE_SPRITE = _note_sprite(NOTE_COLOR)
+ACTIVE_NOTE_SPRITE = _note_sprite(HIGHLIGHT_COLOR)
+
+# MIDI note numbers of the open strings (G3, D4, A4, E5)
+OPEN_STRING_MIDI = [55, 62, 69, 76]
+# Finger positions shown on each string, including the open string
+POSITIONS_PER_STRING = 16
+# Finger position names for each position: 0, -1, 1, 2, 2+, 3, ..., 13
+FRET_LABELS = ["0", "-1", "1", "2", "2+"] + [str(pos_x - 2) for pos_x in range(5, POSITIONS_PER_STRING)]
+# Semitones above C of each natural note
+STEP_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+def _build_note_positions():
+    """Map each MIDI note number to its (position, string index) on the fingerboard, or None."""
+    positions = [None] * 128
+    # Later strings overwrite earlier ones, so a note reachable on two strings
+    # is shown at the lower position on the higher string
+    for string_idx, open_midi in enumerate(OPEN_STRING_MIDI):
+        for pos_x in range(POSITIONS_PER_STRING):
+            positions[open_midi + pos_x] = (pos_x, string_idx)
+    return positions
+
+# This is a simplified mapping of notes to finger positions, indexed by MIDI number
+NOTE_POSITIONS = _build_note_positions()
+
+def _note_midi(note_name):
+    """Return the MIDI number of a note name such as 'C#5' or 'Bb4', or None if it is malformed."""
+    octave_start = len(note_name.rstrip("0123456789"))
+    accidentals, octave = note_name[1:octave_start], note_name[octave_start:]
+    if note_name[:1] not in STEP_SEMITONES or not octave or accidentals.strip("#b"):
+        return None
+    return (int(octave) + 1) * 12 + STEP_SEMITONES[note_name[0]] + accidentals.count("#") - accidentals.count("b")
+
+def _parse_number(text):
+    """Parse a MusicXML numeric value: int for the usual whole tick counts, float for decimals."""
+    text = text.strip()
+    return int(text) if text.isdigit() else float(text)
 
 def parse_musicxml(file_path):
-    """Parse musicxml file and extract notes with timing information."""
+    """Parse musicxml file (a path or binary file object) and extract notes with timing information."""
     tree = ET.parse(file_path)
     root = tree.getroot()
     
@@ -59,58 +94,66 @@ def parse_musicxml(file_path):
     current_time = 0
     
     # Find divisions (ticks per quarter note)
-    divisions = int(root.find('.//divisions').text)
+    divisions = _parse_number(root.find('.//divisions').text)
     
-    # Process each measure
-    for measure in root.findall('.//measure'):
-        for note in measure.findall('note'):
-            # Skip rests
-            if note.find('rest') is not None:
-                if note.find('duration') is not None:
-                    duration = int(note.find('duration').text)
-                    current_time += duration / divisions
-                continue
-            
-            # Get pitch information
-            pitch = note.find('pitch')
-            if pitch is None:
-                continue
-                
-            step = pitch.find('step').text
-            octave = pitch.find('octave').text
-            
-            # Check for accidentals
-            alter_elem = pitch.find('alter')
-            alter = 0
-            if alter_elem is not None:
-                alter = int(alter_elem.text)
-            
-            # Determine the note name
-            accidental = ""
-            if alter == 1:
-                accidental = "#"
-            elif alter == -1:
-                accidental = "b"
-            
-            note_name = f"{step}{accidental}{octave}"
-            
-            # Get duration
-            duration = int(note.find('duration').text)
-            duration_in_seconds = duration / divisions
-            
-            # Add the note to our list
-            notes.append({
-                "note": note_name,
-                "start_time": current_time,
-                "duration": duration_in_seconds
-            })
-            
-            current_time += duration_in_seconds
+    # Notes are only ever children of measures, so walk them in document order directly
+    for note in root.iter('note'):
+        # Index the children in one pass instead of a find() per field;
+        # setdefault keeps the first match, as find() would
+        fields = {}
+        for child in note:
+            fields.setdefault(child.tag, child)
+        
+        # Skip rests
+        if 'rest' in fields:
+            if 'duration' in fields:
+                duration = _parse_number(fields['duration'].text)
+                current_time += duration / divisions
+            continue
+        
+        # Get pitch information
+        pitch = fields.get('pitch')
+        if pitch is None:
+            continue
+        
+        pitch_fields = {}
+        for child in pitch:
+            pitch_fields.setdefault(child.tag, child)
+        step = pitch_fields['step'].text
+        octave = pitch_fields['octave'].text
+        
+        # Check for accidentals
+        alter_elem = pitch_fields.get('alter')
+        alter = 0
+        if alter_elem is not None:
+            # Microtonal alterations (e.g. -0.5) are shown at the nearest semitone
+            alter = round(_parse_number(alter_elem.text))
+        
+        # Determine the note name; double sharps and flats repeat the sign
+        accidental = "#" * alter if alter > 0 else "b" * -alter
+        
+        note_name = f"{step}{accidental}{octave}"
+        
+        # Get duration
+        duration = _parse_number(fields['duration'].text)
+        duration_in_seconds = duration / divisions
+        
+        # Add the note to our list
+        end_time = current_time + duration_in_seconds
+        notes.append({
+            "note": note_name,
+            "start_time": current_time,
+            "duration": duration_in_seconds,
+            "end_time": end_time
+        })
+        
+        current_time = end_time
     
     return notes
 
-def create_fingerboard_frame(notes, current_time, frame_size=(1280, 720)):
-    """Create a single frame of the fingerboard with the current note highlighted."""
+@functools.lru_cache(maxsize=None)
+def _fingerboard_background(frame_size):
+    """Render the static fingerboard (strings, frets and labels) once per frame size."""
     # Create a blank canvas
     img = Image.new('RGB', frame_size, color=(0, 0, 0))
     draw = ImageDraw.Draw(img)
@@ -131,147 +174,234 @@ def create_fingerboard_frame(notes, current_time, frame_size=(1280, 720)):
     
     # Draw fret markers and label the positions
     # Label position 0
-    draw.text((fb_x - 5, fb_y - 20), "0", fill=(150, 150, 150))
+    draw.text((fb_x - 5, fb_y - 20), FRET_LABELS[0], fill=(150, 150, 150))
     # Label the rest of the positions
-    for i in range(1, 16):
+    for i in range(1, POSITIONS_PER_STRING):
         x = fb_x + i * FRET_SPACING
         draw.line([(x, fb_y), (x, fb_y + FB_HEIGHT)], fill=(100, 100, 100), width=1)
-        # Label the positions: 0, -1, 1, 2, 2+, 3, ..., 13
-        if i == 1:
-            label = "-1"
-        elif i == 2:
-            label = "1"
-        elif i == 3:
-            label = "2"
-        elif i == 4:
-            label = "2+"
-        else: # i >= 5
-            label = str(i - 2)
         # Adjust x-position for better alignment
-        draw.text((x - 5, fb_y - 20), label, fill=(150, 150, 150))
+        draw.text((x - 5, fb_y - 20), FRET_LABELS[i], fill=(150, 150, 150))
     
-    # --- Determine Active Notes --- 
-    active_notes_this_frame = []
-    for note in notes:
-        if note["start_time"] <= current_time < note["start_time"] + note["duration"]:
-            active_notes_this_frame.append(note)
-    # --- End Determine Active Notes ---
-
-    # --- Draw Inactive Notes (Blue) --- 
-    for note in notes:
-        if note not in active_notes_this_frame:
-            note_name = note["note"]
-            base_note = note_name # Reset base_note
-
-            # Handle accidentals
-            if "#" in note_name: base_note = note_name.replace("#", "")
-            elif "b" in note_name:
-                step, octave = note_name[0], note_name[-1]
-                if step == "A": base_note = f"G#{octave}"
-                elif step == "B": base_note = f"A#{octave}"
-                elif step == "C": base_note = f"B{int(octave)-1}"
-                elif step == "D": base_note = f"C#{octave}"
-                elif step == "E": base_note = f"D#{octave}"
-                elif step == "F": base_note = f"E{octave}"
-                elif step == "G": base_note = f"F#{octave}"
-            
-            # Get position
-            try:
-                note_pos = NOTE_POSITIONS.get(note_name) or NOTE_POSITIONS.get(base_note)
-                if note_pos:
-                    pos_x, string_idx = note_pos
-                    x = fb_x + pos_x * FRET_SPACING
-                    y = fb_y + (string_idx + 1) * STRING_SPACING
-                    # Draw inactive note
-                    draw.ellipse((x - 10, y - 10, x + 10, y + 10), fill=NOTE_COLOR, outline=(255, 255, 255))
-            except Exception: pass # Ignore errors for inactive notes
-    # --- End Draw Inactive Notes ---
+    return img
+
+def _resolve_note(note_name, fb_x, fb_y):
+    """Return the (x, y, label) of a note on the fingerboard, or None if it has no position."""
+    # Working from the MIDI number handles every enharmonic spelling (Bb, Cb, E#, ...)
+    midi = _note_midi(note_name)
+    if midi is None or not 0 <= midi < len(NOTE_POSITIONS):
+        return None
+    note_pos = NOTE_POSITIONS[midi]
+    if note_pos is None:
+        return None
+    pos_x, string_idx = note_pos
+    x = fb_x + pos_x * FRET_SPACING
+    y = fb_y + (string_idx + 1) * STRING_SPACING
+
+    # Label the note letter with the finger position (e.g., 'E1', 'C2+')
+    return x, y, f"{note_name[0]}{FRET_LABELS[pos_x]}"
 
+def _draw_score_background(xs, ys, placed, frame_size):
+    """Draw every placed note as inactive onto the fingerboard; the result is shared by all frames."""
+    img = _fingerboard_background(frame_size).copy()
+    for index in np.flatnonzero(placed).tolist():
+        img.paste(INACTIVE_NOTE_SPRITE, (xs[index] - NOTE_RADIUS, ys[index] - NOTE_RADIUS), INACTIVE_NOTE_SPRITE)
+    return img
+
+def _draw_note_layer(score_background, xs, ys, labels, placed, active_indices):
+    """Highlight the active notes on the score background; returns the image and active labels."""
+    img = score_background.copy()
+    draw = ImageDraw.Draw(img)
+    
     # --- Draw Active Notes (Red) and Labels --- 
     active_note_names = []
-    for note in active_notes_this_frame: # Iterate only through active notes
-        note_name = note["note"]
-        base_note = note_name # Reset base_note
-
-        # Handle accidentals (same logic as above)
-        if "#" in note_name: base_note = note_name.replace("#", "")
-        elif "b" in note_name:
-            step, octave = note_name[0], note_name[-1]
-            if step == "A": base_note = f"G#{octave}"
-            elif step == "B": base_note = f"A#{octave}"
-            elif step == "C": base_note = f"B{int(octave)-1}"
-            elif step == "D": base_note = f"C#{octave}"
-            elif step == "E": base_note = f"D#{octave}"
-            elif step == "F": base_note = f"E{octave}"
-            elif step == "G": base_note = f"F#{octave}"
-
-        # Get position
-        try:
-            note_pos = NOTE_POSITIONS.get(note_name) or NOTE_POSITIONS.get(base_note)
-            if note_pos:
-                pos_x, string_idx = note_pos
-                x = fb_x + pos_x * FRET_SPACING
-                y = fb_y + (string_idx + 1) * STRING_SPACING
-
-                # Draw the active note in highlight color (overwriting if necessary)
-                draw.ellipse((x - 10, y - 10, x + 10, y + 10), fill=HIGHLIGHT_COLOR, outline=(255, 255, 255))
-
-                # Determine the finger position label based on pos_x
-                if pos_x == 0:
-                    fret_label = "0"
-                elif pos_x == 1:
-                    fret_label = "-1"
-                elif pos_x == 2:
-                    fret_label = "1"
-                elif pos_x == 3:
-                    fret_label = "2"
-                elif pos_x == 4:
-                    fret_label = "2+"
-                else: # pos_x >= 5
-                    fret_label = str(pos_x - 2)
-
-                # Display note name above using the finger position label
-                step = note["note"][0]  # Get the note letter (e.g., 'E')
-                new_label = f"{step}{fret_label}"  # Create the new label (e.g., 'E1', 'C2+')
-                draw.text((x - 15, y - 30), new_label, fill=(255, 255, 255))
-
-                active_note_names.append(new_label) # Add the new label to list for title
-        except Exception as e:
-             # print(f"Warning: Could not process active note {note} at time {current_time}: {e}") # Optional debug
-             pass
+    for index in active_indices:
+        if not placed[index]:
+            continue
+        x, y, label = xs[index], ys[index], labels[index]
+        # Draw the active note in highlight color (overwriting if necessary)
+        img.paste(ACTIVE_NOTE_SPRITE, (x - NOTE_RADIUS, y - NOTE_RADIUS), ACTIVE_NOTE_SPRITE)
+        # Display the note name and finger position above it
+        draw.text((x - 15, y - 30), label, fill=(255, 255, 255))
+        active_note_names.append(label)
     # --- End Draw Active Notes ---
 
-    # Add some information at the top
+    return img, active_note_names
+
+def _frame_renderer(notes, frame_size=(1280, 720)):
+    """Return a function mapping a time to its frame as a PIL image, reusing work across frames with the same active notes."""
+    frame_size = tuple(frame_size)
+    # Keep the per-note data the frames need as parallel arrays rather than
+    # looking keys up in the note dicts every frame
+    starts = np.array([note["start_time"] for note in notes], dtype=float)
+    # parse_musicxml stores each note's end; hand-built note lists may omit it
+    ends = np.array([note.get("end_time", note["start_time"] + note["duration"]) for note in notes], dtype=float)
+    order = np.argsort(starts, kind="stable")
+    sorted_starts = starts[order]
+    # Running maximum of end times in start order: every note before the first
+    # entry past the current time has already finished
+    ended_by = np.maximum.accumulate(ends[order])
+
+    # Everything fixed by the frame size is worked out once, not per frame
+    fb_x = (frame_size[0] - FB_WIDTH) // 2
+    fb_y = (frame_size[1] - FB_HEIGHT) // 2
+    title_position = (frame_size[0] // 2 - 150, 30)
+
+    # Resolve every note to its fingerboard coordinates and label once
+    placements = [_resolve_note(note["note"], fb_x, fb_y) for note in notes]
+    placed = np.array([placement is not None for placement in placements], dtype=bool)
+    xs = [placement[0] if placement else 0 for placement in placements]
+    ys = [placement[1] if placement else 0 for placement in placements]
+    labels = [placement[2] if placement else None for placement in placements]
+
+    # Inactive markers look the same in every frame, so they are drawn once
+    # and each active marker simply covers its inactive one
+    score_background = _draw_score_background(xs, ys, placed, frame_size)
+
+    # Held notes keep the same active set for many consecutive frames
+    @functools.lru_cache(maxsize=8)
+    def note_layer(active_indices):
+        layer, active_note_names = _draw_note_layer(score_background, xs, ys, labels, placed, active_indices)
+        # Display active note name(s) at the top, or just the time; only the
+        # time changes between frames, so the rest of the title is kept too
+        if active_note_names:
+            return layer, f"Now Playing: {', '.join(active_note_names)} (Time: ", "s)"
+        return layer, "Time: ", "s"
+
+    def render(current_time):
+        # --- Determine Active Notes --- 
+        first = np.searchsorted(ended_by, current_time, side="right")
+        last = np.searchsorted(sorted_starts, current_time, side="right")
+        candidates = order[first:last]
+        active_indices = tuple(np.sort(candidates[ends[candidates] > current_time]).tolist())
+        # --- End Determine Active Notes ---
+
+        layer, title_prefix, title_suffix = note_layer(active_indices)
+        img = layer.copy()
+        draw = ImageDraw.Draw(img)
+        title = f"{title_prefix}{current_time:.2f}{title_suffix}"
+        draw.text(title_position, title, fill=(255, 255, 255), font=TITLE_FONT)
+
+        return img
+
+    return render
+
+def create_fingerboard_frame(notes, current_time, frame_size=(1280, 720)):
+    """Create a single frame of the fingerboard with the current note highlighted."""
+    return np.array(_frame_renderer(notes, frame_size)(current_time), dtype=np.uint8)
+
+# Encoder arguments for NVENC hardware and libx264 software encoding; NVENC
+# gets an explicit bitrate since its default rate control varies by driver
+NVENC_CODEC_ARGS = ["-c:v", "h264_nvenc", "-preset", "p4", "-b:v", "5M"]
+X264_CODEC_ARGS = ["-c:v", "libx264", "-preset", "veryfast"]
+
+@functools.lru_cache(maxsize=None)
+def _video_codec_args():
+    """Return ffmpeg's encoder arguments, preferring NVENC hardware encoding when it works here."""
+    # Builds list h264_nvenc even without a usable GPU, so probe with a tiny test encode
+    probe = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=size=256x256:duration=0.1", *NVENC_CODEC_ARGS, "-f", "null", "-",
+    ]
     try:
-        font = ImageFont.truetype("Arial", 24)
-    except:
-        font = ImageFont.load_default()
+        if subprocess.run(probe, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0:
+            return NVENC_CODEC_ARGS
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    return X264_CODEC_ARGS
 
-    # Display active note name(s) at the top, or just the time
-    if active_note_names:
-        title = f"Now Playing: {', '.join(active_note_names)} (Time: {current_time:.2f}s)"
-    else:
-        title = f"Time: {current_time:.2f}s"
+# Number of trailing ffmpeg error lines reported when an encode fails
+FFMPEG_ERROR_LINES = 20
 
-    draw.text((frame_size[0] // 2 - 150, 30), title, fill=(255, 255, 255), font=font)
-    
-    return np.array(img, dtype=np.uint8)
+def _encode_frames(cmd, frames, output_file):
+    """Feed raw frame bytes to an ffmpeg command, raising RuntimeError with its error output if it fails."""
+    # A file rather than a pipe, so ffmpeg can never block on stderr while we write
+    with tempfile.TemporaryFile() as stderr_file:
+        with subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr_file) as proc:
+            try:
+                for frame_bytes in frames:
+                    proc.stdin.write(frame_bytes)
+                proc.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg quit early (bad output path, encoder failure, ...); its
+                # exit status and error output below say why
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            error_lines = stderr_file.read().decode(errors="replace").splitlines()[-FFMPEG_ERROR_LINES:]
+            raise RuntimeError(
+                f"ffmpeg exited with status {proc.returncode} while writing {output_file}: " + "\n".join(error_lines)
+            )
+
+# Frames handed to a render worker at a time; consecutive frames share cached note layers
+RENDER_CHUNK_FRAMES = 32
+
+# Videos shorter than this render in-process: starting spawn workers costs
+# more than the cached renderer needs for a short score
+PARALLEL_MIN_FRAMES = 1800
+
+# Frame renderer of the current render worker process
+_worker_render = None
 
-def make_video(notes, output_file="violin_tutorial.mp4", fps=30, duration=None):
-    """Create a video tutorial of the notes to be played on the violin."""
+def _init_render_worker(notes, frame_size):
+    """Build the frame renderer once in each render worker process."""
+    global _worker_render
+    _worker_render = _frame_renderer(notes, frame_size)
+
+def _render_frame_bytes(current_time):
+    """Render a frame in a worker process and return its raw RGB bytes."""
+    return _worker_render(current_time).tobytes()
+
+def make_video(notes, output_file="violin_tutorial.mp4", fps=30, duration=None, frame_size=(1280, 720), workers=None):
+    """Create a video tutorial of the notes to be played on the violin.
+
+    Videos of at least PARALLEL_MIN_FRAMES frames are rendered across `workers`
+    processes (default: one per CPU); pass workers=1 to always render in this
+    process. Worker processes re-import the caller's __main__ module, so
+    callers without a __main__ guard (such as Streamlit scripts) must pass 1.
+    """
     if duration is None:
         # Calculate duration from the last note
         last_note = notes[-1]
         duration = last_note["start_time"] + last_note["duration"] + 1  # Add 1 second buffer at the end
     
-    # Create a clip using MoviePy
-    clip = VideoClip(lambda t: create_fingerboard_frame(notes, t), duration=duration)
+    frame_times = [frame_index / fps for frame_index in range(math.ceil(duration * fps))]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(frame_times) < PARALLEL_MIN_FRAMES:
+        workers = 1
+    workers = min(workers, math.ceil(len(frame_times) / RENDER_CHUNK_FRAMES))
     
-    # Set the frame rate
-    clip = clip.with_fps(fps)
-    
-    # Write the result to a file
-    clip.write_videofile(output_file, codec="libx264", fps=fps)
+    def encode(codec_args):
+        # Stream raw RGB frames straight into ffmpeg's stdin for encoding
+        width, height = frame_size
+        cmd = [
+            imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            *codec_args, "-pix_fmt", "yuv420p", output_file,
+        ]
+        if workers > 1:
+            # spawn rather than fork: callers such as the Streamlit app are multithreaded
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(workers, initializer=_init_render_worker, initargs=(notes, frame_size)) as pool:
+                frames = pool.imap(_render_frame_bytes, frame_times, chunksize=RENDER_CHUNK_FRAMES)
+                _encode_frames(cmd, frames, output_file)
+        else:
+            render = _frame_renderer(notes, frame_size)
+            # PIL's RGB buffer is already the rgb24 layout ffmpeg expects
+            _encode_frames(cmd, (render(current_time).tobytes() for current_time in frame_times), output_file)
+
+    codec_args = _video_codec_args()
+    try:
+        encode(codec_args)
+    except RuntimeError:
+        if codec_args is X264_CODEC_ARGS:
+            raise
+        # NVENC passed the probe but can still fail mid-run, e.g. once the GPU's
+        # concurrent session limit is reached; redo the video in software
+        encode(X264_CODEC_ARGS)
     
     return output_file
 
@@ -283,6 +413,7 @@ def main():
     parser.add_argument("input_file", help="Input MusicXML file")
     parser.add_argument("--output", "-o", default="violin_tutorial.mp4", help="Output video file (default: violin_tutorial.mp4)")
     parser.add_argument("--fps", type=int, default=30, help="Frames per second (default: 30)")
+    parser.add_argument("--workers", type=int, default=None, help="Frame rendering processes (default: one per CPU)")
     
     args = parser.parse_args()
     
@@ -298,7 +429,7 @@ def main():
         return
     
     print(f"Found {len(notes)} notes. Generating video...")
-    output_file = make_video(notes, output_file=args.output, fps=args.fps)
+    output_file = make_video(notes, output_file=args.output, fps=args.fps, workers=args.workers)
     
     print(f"Video generated: {output_file}")
 
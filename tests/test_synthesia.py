@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import synthesia
+
+
+NOTES = [{"note": "A4", "start_time": 0.0, "duration": 0.5, "end_time": 0.5}]
+
+
+class MakeVideoTest(unittest.TestCase):
+    def test_writes_video(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, "out.mp4")
+            synthesia.make_video(NOTES, output_file=output_file, duration=0.5, workers=1)
+            self.assertGreater(os.path.getsize(output_file), 0)
+
+    def test_failed_nvenc_encode_falls_back_to_libx264(self):
+        # Pretend the probe found NVENC; this host cannot encode with it
+        with mock.patch.object(synthesia, "_video_codec_args", return_value=synthesia.NVENC_CODEC_ARGS), \
+                tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, "out.mp4")
+            synthesia.make_video(NOTES, output_file=output_file, duration=0.5, workers=1)
+            self.assertGreater(os.path.getsize(output_file), 0)
+
+    def test_ffmpeg_failure_raises_runtime_error(self):
+        # ffmpeg cannot open the output, exits early and closes its stdin
+        with self.assertRaisesRegex(RuntimeError, "ffmpeg exited with status"):
+            synthesia.make_video(NOTES, output_file="/nonexistent_dir/out.mp4", duration=0.5, workers=1)
+
+
+if __name__ == "__main__":
+    unittest.main()